@@ -1,7 +1,7 @@
 from flask import Blueprint, request, jsonify, current_app
 from .extensions import db, limiter
 from .models import User, RefreshToken
-from passlib.hash import bcrypt  # Use bcrypt instead of argon2 to avoid crypt module
+import bcrypt
 from .utils.jwt_utils import (
     create_access_token,
     create_refresh_token_jwt,
@@ -13,9 +13,25 @@ from .utils.jwt_utils import (
 from .schemas import AuthRequest, AuthResponse, RefreshRequest, RefreshResponse
 from datetime import datetime, timezone
 import jwt
+from sqlalchemy import insert, update
 
 auth_bp = Blueprint("auth", __name__)
 
+BCRYPT_ROUNDS = 12
+
+
+# bcrypt's C extension releases the GIL during the key schedule, so other
+# request threads (gthread workers) keep running while a hash is computed
+def hash_password(password: str) -> str:
+    """Hash a password with bcrypt at BCRYPT_ROUNDS"""
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+    return bcrypt.hashpw(password.encode(), salt).decode()
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Check a password against a bcrypt hash"""
+    return bcrypt.checkpw(password.encode(), password_hash.encode())
+
 
 def get_client_info(request):
     """Extract client information for security tracking"""
@@ -27,23 +43,25 @@ def get_client_info(request):
 
 def create_token_pair(user_id: int, client_info: str = None):
     """Create both access and refresh tokens for a user"""
-    # Create refresh token in database
-    refresh_token_record = RefreshToken(
-        token=RefreshToken.generate_token(),
-        user_id=user_id,
-        expires_at=get_refresh_token_expiry(),
-        client_info=client_info,
-    )
-    db.session.add(refresh_token_record)
-    db.session.flush()  # Get the ID
+    # Create refresh token in database; RETURNING hands back the ID in the same trip
+    refresh_token_id = db.session.execute(
+        insert(RefreshToken)
+        .values(
+            token=RefreshToken.generate_token(),
+            user_id=user_id,
+            expires_at=get_refresh_token_expiry(),
+            client_info=client_info,
+        )
+        .returning(RefreshToken.id)
+    ).scalar_one()
 
     # Create JWT tokens
     access_token = create_access_token(sub=user_id)
     refresh_token_jwt = create_refresh_token_jwt(
-        sub=user_id, refresh_token_id=str(refresh_token_record.id)
+        sub=user_id, refresh_token_id=str(refresh_token_id)
     )
 
-    return access_token, refresh_token_jwt, refresh_token_record
+    return access_token, refresh_token_jwt, refresh_token_id
 
 
 @auth_bp.route("/register", methods=["POST"])
@@ -58,8 +76,7 @@ def register():
     if db.session.query(User).filter_by(username=payload.username).first():
         return jsonify({"error": "user_exists"}), 400
 
-    # Use bcrypt instead of argon2 to avoid crypt module deprecation warnings
-    pw_hash = bcrypt.hash(payload.password)
+    pw_hash = hash_password(payload.password)
     u = User(username=payload.username, password_hash=pw_hash)
     db.session.add(u)
     db.session.commit()
@@ -79,15 +96,12 @@ def login():
     if not user:
         return jsonify({"error": "invalid_credentials"}), 401
 
-    # Use bcrypt.verify instead of argon2.verify
-    if not bcrypt.verify(payload.password, user.password_hash):
+    if not verify_password(payload.password, user.password_hash):
         return jsonify({"error": "invalid_credentials"}), 401
 
     # Create token pair
     client_info = str(get_client_info(request))
-    access_token, refresh_token, refresh_record = create_token_pair(
-        user.id, client_info
-    )
+    access_token, refresh_token, _ = create_token_pair(user.id, client_info)
 
     db.session.commit()
 
@@ -143,17 +157,31 @@ def refresh():
                 401,
             )
 
-        # Update last used timestamp
-        refresh_record.last_used_at = datetime.now(timezone.utc)
-
-        # Revoke the old refresh token (token rotation)
-        refresh_record.revoke()
+        # Revoke the old refresh token (token rotation) and record its last use.
+        # Guarding on revoked_at makes a concurrent reuse of the same token lose.
+        now = datetime.now(timezone.utc)
+        revoked = db.session.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.id == refresh_token_id, RefreshToken.revoked_at.is_(None)
+            )
+            .values(revoked_at=now, last_used_at=now)
+        )
+        if revoked.rowcount == 0:
+            db.session.rollback()
+            return (
+                jsonify(
+                    {
+                        "error": "invalid_refresh_token",
+                        "details": "Token expired or revoked",
+                    }
+                ),
+                401,
+            )
 
         # Create new token pair
         client_info = str(get_client_info(request))
-        access_token, new_refresh_token, new_refresh_record = create_token_pair(
-            user_id, client_info
-        )
+        access_token, new_refresh_token, _ = create_token_pair(user_id, client_info)
 
         db.session.commit()
 
@@ -229,22 +257,16 @@ def revoke_all():
     def _revoke_all():
         user_id = request.user
 
-        # Revoke all active refresh tokens for the user
-        active_tokens = (
-            db.session.query(RefreshToken)
-            .filter_by(user_id=user_id, revoked_at=None)
-            .all()
+        # Revoke all active refresh tokens for the user in a single UPDATE
+        result = db.session.execute(
+            update(RefreshToken)
+            .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=datetime.now(timezone.utc))
         )
-
-        for token in active_tokens:
-            token.revoke()
-
         db.session.commit()
 
         return (
-            jsonify(
-                {"status": "ok", "message": f"Revoked {len(active_tokens)} tokens"}
-            ),
+            jsonify({"status": "ok", "message": f"Revoked {result.rowcount} tokens"}),
             200,
         )
 
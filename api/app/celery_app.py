@@ -17,6 +17,10 @@ def make_celery(app=None):
         timezone="UTC",
         enable_utc=True,
         broker_connection_retry_on_startup=True,  # Fix for deprecation warning
+        # Hand out one task at a time and ack after completion so a long
+        # residual computation doesn't hold queued ingestion tasks hostage
+        worker_prefetch_multiplier=1,
+        task_acks_late=True,
         beat_schedule={
             "fetch-weather-data": {
                 "task": "app.tasks.fetch_weather_data",
@@ -1,16 +1,21 @@
 from typing import Dict, Tuple
 from math import isfinite
 
+_LOGISTICS_MULT = {"farmgate": 0.90, "wholesale": 1.00, "retail": 1.20}
+
 
 def distance_weighted_base(
     prices: Dict[str, float], distances: Dict[str, float]
 ) -> float:
-    weights = {}
+    # One pass over the dicts for sum(w * p) and sum(w); with the handful of
+    # markets an estimate sees this beats building arrays first
+    num = 0.0
+    z = 0.0
     for m, p in prices.items():
-        d = max(0.0, float(distances.get(m, 0.0)))
-        weights[m] = 1.0 / (1.0 + d)
-    z = sum(weights.values()) or 1.0
-    return sum(weights[m] * prices[m] for m in prices) / z
+        w = 1.0 / (1.0 + max(0.0, float(distances.get(m, 0.0))))
+        num += w * p
+        z += w
+    return num / (z or 1.0)
 
 
 def ewma(curr: float, prev: float | None, alpha: float = 0.4) -> float:
@@ -32,13 +37,18 @@ def estimate(
     k2: float = 0.08,
     k3: float = 0.12,
     alpha: float = 0.4,
+    sigma: float | None = None,
 ) -> Tuple[float, Tuple[float, float], Dict]:
     base_raw = distance_weighted_base(prices_now, distances)
     base_smoothed = ewma(base_raw, prev_base, alpha)
 
-    logistics_map = {"farmgate": 0.90, "wholesale": 1.00, "retail": 1.20}
+    # Clamp to the ranges the request schema allows
+    season_index = min(max(season_index, -1.0), 1.0)
+    shock_index = min(max(shock_index, -1.0), 1.0)
+    weather_index = min(max(weather_index, 0.0), 1.0)
+
     adj_season = 1 + k1 * season_index
-    adj_logistics = logistics_map.get(logistics_mode, 1.0)
+    adj_logistics = _LOGISTICS_MULT.get(logistics_mode, 1.0)
     adj_shock = 1 + k2 * shock_index
     adj_weather = 1 + k3 * weather_index
 
@@ -51,8 +61,9 @@ def estimate(
         * variety_grade_factor
     )
 
-    # fallback sigma based on scale (caller should compute real residual sigma)
-    sigma = max(0.5, 0.03 * p_hat) if isfinite(p_hat) else 1.0
+    # fallback sigma based on scale unless the caller has a real residual sigma
+    if sigma is None:
+        sigma = max(0.5, 0.03 * p_hat) if isfinite(p_hat) else 1.0
 
     explain = {
         "base_smoothed": round(base_smoothed, 3),
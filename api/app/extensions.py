@@ -2,14 +2,35 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
+import hmac
 import os
+import time
 import redis
-from flask import current_app
+from urllib.parse import urlparse
+from flask import current_app, request
+from sqlalchemy import event
 
 db = SQLAlchemy()
 migrate = Migrate()
 
 
+def init_query_timing(app):
+    """Log SQL statements that take longer than SLOW_QUERY_THRESHOLD seconds"""
+    threshold = app.config.get("SLOW_QUERY_THRESHOLD", 0.1)
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _log_slow_query(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        if elapsed > threshold:
+            app.logger.warning(f"Slow query ({elapsed:.3f}s): {statement}")
+
+
 # Initialize limiter with Redis storage URI from environment
 def get_limiter_storage_uri():
     """Get the Redis storage URI for rate limiting"""
@@ -21,15 +42,51 @@ def get_limiter_storage_uri():
     return storage_url
 
 
-# Initialize limiter with Redis storage
-limiter = Limiter(key_func=get_remote_address, storage_uri=get_limiter_storage_uri())
+def is_internal_request():
+    """Skip rate limiting for trusted internal callers presenting X-Internal-Token"""
+    expected = current_app.config.get("INTERNAL_API_TOKEN")
+    if not expected:
+        return False
+    provided = request.headers.get("X-Internal-Token", "")
+    return hmac.compare_digest(provided.encode(), expected.encode())
+
+
+def get_limiter_storage_options(storage_uri):
+    """Share a blocking pool across threads when the limiter is backed by Redis"""
+    if urlparse(storage_uri).scheme not in ("redis", "rediss"):
+        return {}
+    return {
+        "connection_pool": redis.BlockingConnectionPool.from_url(
+            storage_uri, max_connections=64
+        )
+    }
+
+
+# Initialize limiter with Redis storage. Fixed-window needs a single INCR+EXPIRE
+# round-trip per check, and a blocking pool keeps connections reused across threads
+_limiter_storage_uri = get_limiter_storage_uri()
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=_limiter_storage_uri,
+    strategy="fixed-window",
+    storage_options=get_limiter_storage_options(_limiter_storage_uri),
+)
 
 _redis_client = None
 
 
-def get_redis():
+def init_redis(app):
+    """Create the shared Redis client on a thread-safe blocking connection pool"""
     global _redis_client
-    if _redis_client is None:
-        url = current_app.config.get("REDIS_URL")
-        _redis_client = redis.from_url(url, decode_responses=True)
+    pool = redis.BlockingConnectionPool.from_url(
+        app.config["REDIS_URL"],
+        max_connections=64,
+        timeout=5,
+        socket_keepalive=True,
+        decode_responses=True,
+    )
+    _redis_client = redis.Redis(connection_pool=pool)
+
+
+def get_redis():
     return _redis_client
@@ -1,14 +1,16 @@
 import os
 from flask import Flask
-from .extensions import db, migrate, limiter
+from .extensions import db, migrate, limiter, init_query_timing, init_redis
 from .auth import auth_bp
 from .prices import prices_bp
 from .weather import weather_bp
 from .config import config
+from .utils.json_utils import OrjsonProvider
 
 
 def create_app(config_name=None):
     app = Flask(__name__)
+    app.json = OrjsonProvider(app)
 
     # Load configuration
     config_name = config_name or os.getenv("FLASK_ENV", "development")
@@ -17,6 +19,8 @@ def create_app(config_name=None):
     # Initialize extensions
     db.init_app(app)
     migrate.init_app(app, db)
+    init_query_timing(app)
+    init_redis(app)
 
     # Configure rate limiter - skip initialization in testing to avoid warnings
     if not app.config.get("TESTING"):
@@ -20,6 +20,14 @@ class User(db.Model):
 
 class RefreshToken(db.Model):
     __tablename__ = "refresh_tokens"
+    # Partial index backing /auth/revoke-all's "active tokens for user" lookup
+    __table_args__ = (
+        db.Index(
+            "ix_refresh_tokens_active_user",
+            "user_id",
+            postgresql_where=db.text("revoked_at IS NULL"),
+        ),
+    )
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String(128), unique=True, nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
@@ -32,6 +40,8 @@ class RefreshToken(db.Model):
     @staticmethod
     def generate_token():
         """Generate a cryptographically secure random token"""
+        # Deliberately read straight from the OS CSPRNG: a per-process DRBG seeded
+        # at import would replay the same stream in every forked gunicorn worker
         return secrets.token_urlsafe(64)
 
     @property
@@ -78,6 +88,8 @@ class MarketPrice(db.Model):
     source = db.Column(db.String(64))
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (db.Index("ix_market_prices_market_date", "market_id", "date"),)
+
 
 class WeatherData(db.Model):
     __tablename__ = "weather_data"
@@ -89,6 +101,9 @@ class WeatherData(db.Model):
     weather_index = db.Column(db.Float)  # normalized index used by estimator
     raw = db.Column(JSON, nullable=True)
 
+    # Serves latest-per-market (scanned backwards) and per-market time ranges
+    __table_args__ = (db.Index("ix_weather_data_market_ts", "market_id", "timestamp"),)
+
 
 class ModelState(db.Model):
     __tablename__ = "model_state"
@@ -1,25 +1,42 @@
-import json
 import hashlib
+import orjson
 from flask import Blueprint, request, jsonify
+from sqlalchemy import and_, func, select
 from .schemas import EstimateRequest, EstimateResponse
 from .decorators import jwt_required
-from .extensions import db, get_redis, limiter
+from .extensions import db, get_redis, is_internal_request, limiter
 from .models import Market, MarketPrice, WeatherData, ModelState
 from .estimator import estimate as estimator_fn
+from .utils.http_utils import etag_json_response
 
 prices_bp = Blueprint("prices", __name__)
 
 
+def latest_prices_subquery():
+    """Rank each market's prices newest-first so rn == 1 is the latest row"""
+    return select(
+        MarketPrice.market_id,
+        MarketPrice.price_kg,
+        MarketPrice.date,
+        MarketPrice.source,
+        func.row_number()
+        .over(partition_by=MarketPrice.market_id, order_by=MarketPrice.date.desc())
+        .label("rn"),
+    ).subquery()
+
+
 def get_cache_key(req_data):
     """Generate cache key from request parameters"""
-    # Sort the dict to ensure consistent hashing
-    normalized = json.dumps(req_data, sort_keys=True)
-    return f"estimate:{hashlib.md5(normalized.encode()).hexdigest()}"
+    # Sort the keys to ensure consistent hashing; orjson emits bytes directly
+    h = hashlib.blake2b(digest_size=16)
+    h.update(orjson.dumps(req_data, option=orjson.OPT_SORT_KEYS))
+    return "estimate:" + h.hexdigest()
 
 
 @prices_bp.route("/estimate", methods=["POST"])
 @jwt_required
-@limiter.limit("120 per minute")  # Rate limit price estimates
+# Rate limit price estimates; trusted internal callers skip the Redis check
+@limiter.limit("120 per minute", exempt_when=is_internal_request)
 def estimate_price():
     body = request.get_json()
     try:
@@ -27,87 +44,92 @@ def estimate_price():
     except Exception as e:
         return jsonify({"error": "invalid_payload", "details": str(e)}), 400
 
-    # Check Redis cache first
+    # Check Redis cache first — estimate, weather and sigma in one round-trip
     redis_client = get_redis()
     cache_key = get_cache_key(body)
 
+    cache_available = True
+    cached_result = cached_weather = cached_sigma = None
     try:
-        cached_result = redis_client.get(cache_key)
-        if cached_result:
-            return jsonify(json.loads(cached_result)), 200
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.get(cache_key)
+        pipe.get(f"weather:latest:{req.location}")
+        pipe.get(f"sigma:{req.location}")
+        cached_result, cached_weather, cached_sigma = pipe.execute()
     except Exception:
-        pass  # Continue if cache fails
+        cache_available = False  # Continue with database fallbacks if cache fails
+
+    if cached_result:
+        return etag_json_response(cached_result)
 
     # 1) Resolve markets nearby — for now: use a hard-coded set: Nairobi, Nakuru, Nyeri
     # In production: query Market table for nearby markets to req.location
     markets = ["Nairobi", "Nakuru", "Nyeri"]
 
-    # 2) Get latest prices either from overrides or DB
+    # 2) Get latest prices either from overrides or DB — one query for all markets
+    latest = latest_prices_subquery()
+    rows = db.session.execute(
+        select(Market.name, Market.friction_map, latest.c.price_kg)
+        .outerjoin(latest, and_(latest.c.market_id == Market.id, latest.c.rn == 1))
+        .where(Market.name.in_(markets))
+    ).all()
+    market_rows = {row.name: row for row in rows}
+
     prices_now = {}
     distances = {}
     for m in markets:
+        row = market_rows.get(m)
         if req.overrides and m in req.overrides:
             prices_now[m] = float(req.overrides[m])
         else:
-            # get latest market price
-            mp = (
-                db.session.query(MarketPrice)
-                .join(Market, Market.id == MarketPrice.market_id)
-                .filter(Market.name == m)
-                .order_by(MarketPrice.date.desc())
-                .first()
-            )
-            prices_now[m] = mp.price_kg if mp else 0.0
+            has_price = row is not None and row.price_kg is not None
+            prices_now[m] = row.price_kg if has_price else 0.0
 
         # friction map / distance — try to get from Market.friction_map
-        market = db.session.query(Market).filter_by(name=m).first()
-        if market and market.friction_map:
-            distances[m] = market.friction_map.get(req.location, 100.0)
+        if row and row.friction_map:
+            distances[m] = row.friction_map.get(req.location, 100.0)
         else:
             # fallback static distances (placeholder)
             distances[m] = 100.0 if m == "Nairobi" else 80.0 if m == "Nakuru" else 60.0
 
-    # 3) get prev_base from ModelState
-    prev_base = None
-    state = db.session.query(ModelState).filter_by(key=f"base:{req.location}").first()
-    if state:
-        prev_base = state.value.get("base")
+    # 3) get prev_base from ModelState. The row is read fresh and locked on every
+    # request, so the read-smooth-write below never works from another worker's
+    # stale base, and it's the same row step 7 updates
+    db_state = (
+        db.session.query(ModelState)
+        .filter_by(key=f"base:{req.location}")
+        .with_for_update()
+        .first()
+    )
+    prev_base = db_state.value.get("base") if db_state and db_state.value else None
 
     # 4) weather_index: use override or latest WeatherData for the target location (if exists)
     weather_index = req.weather_override if req.weather_override is not None else 0.0
 
-    # Try Redis cache first for weather
-    try:
-        cached_weather = redis_client.get(f"weather:latest:{req.location}")
-        if cached_weather:
-            weather_data = json.loads(cached_weather)
-            weather_index = weather_data.get("weather_index", 0.0)
-    except Exception:
-        # Fallback to database
-        w = (
-            db.session.query(WeatherData)
+    # Prefer the cached weather; fall back to the database if Redis is down
+    if cached_weather:
+        weather_index = orjson.loads(cached_weather).get("weather_index", 0.0)
+    elif not cache_available:
+        db_weather_index = db.session.execute(
+            select(WeatherData.weather_index)
             .join(Market, Market.id == WeatherData.market_id)
-            .filter(Market.name == req.location)
+            .where(Market.name == req.location)
             .order_by(WeatherData.timestamp.desc())
-            .first()
-        )
-        if w:
-            weather_index = w.weather_index
+            .limit(1)
+        ).scalar()
+        if db_weather_index is not None:
+            weather_index = db_weather_index
 
     # 5) Get dynamic sigma from cache or database
     sigma = 1.0  # default fallback
-    try:
-        cached_sigma = redis_client.get(f"sigma:{req.location}")
-        if cached_sigma:
-            sigma_data = json.loads(cached_sigma)
-            sigma = sigma_data.get("sigma", 1.0)
-    except Exception:
-        # Fallback to database
-        sigma_state = (
-            db.session.query(ModelState).filter_by(key=f"sigma:{req.location}").first()
-        )
-        if sigma_state:
-            sigma = sigma_state.value.get("sigma", 1.0)
+    if cached_sigma:
+        sigma = orjson.loads(cached_sigma).get("sigma", 1.0)
+    elif not cache_available:
+        sigma_value = db.session.execute(
+            select(ModelState.value).where(ModelState.key == f"sigma:{req.location}")
+        ).scalar()
+        if sigma_value:
+            sigma = sigma_value.get("sigma", 1.0)
 
     # 6) compute estimate
     p_hat, band, explain = estimator_fn(
@@ -119,15 +141,10 @@ def estimate_price():
         shock_index=req.shock_index or 0.0,
         variety_grade_factor=req.variety_grade_factor,
         weather_index=weather_index,
+        sigma=sigma,  # dynamic sigma for the confidence band
     )
 
-    # Use dynamic sigma for confidence band
-    confidence_band = [float(p_hat - sigma), float(p_hat + sigma)]
-
     # 7) persist new base into model state
-    db_state = (
-        db.session.query(ModelState).filter_by(key=f"base:{req.location}").first()
-    )
     if db_state:
         db_state.value = {"base": explain["base_smoothed"]}
     else:
@@ -139,50 +156,57 @@ def estimate_price():
 
     resp = EstimateResponse(
         estimate=round(p_hat, 2),
-        range=[round(confidence_band[0], 2), round(confidence_band[1], 2)],
+        range=[round(band[0], 2), round(band[1], 2)],
         explain=explain,
         sources=["KAMIS/NPCK (db)"],
     )
 
     # Cache the result for 5 minutes
-    result_json = resp.model_dump()
+    result_body = resp.model_dump_json().encode()
     try:
-        redis_client.setex(cache_key, 300, json.dumps(result_json))
+        redis_client.setex(cache_key, 300, result_body)
     except Exception:
         pass  # Continue if cache fails
 
-    return jsonify(result_json), 200
+    return etag_json_response(result_body)
 
 
 @prices_bp.route("/markets", methods=["GET"])
 def list_markets():
     """Get list of all markets with latest prices"""
     try:
-        markets = db.session.query(Market).all()
-        result = []
-
-        for market in markets:
-            # Get latest price for this market
-            latest_price = (
-                db.session.query(MarketPrice)
-                .filter(MarketPrice.market_id == market.id)
-                .order_by(MarketPrice.date.desc())
-                .first()
+        latest = latest_prices_subquery()
+        # Plain column tuples: no ORM instances or identity-map bookkeeping
+        rows = db.session.execute(
+            select(
+                Market.id,
+                Market.name,
+                Market.county,
+                Market.lat,
+                Market.lon,
+                latest.c.price_kg,
+                latest.c.date,
+                latest.c.source,
             )
+            .outerjoin(latest, and_(latest.c.market_id == Market.id, latest.c.rn == 1))
+            .order_by(Market.id)
+        ).all()
+        result = []
 
+        for id_, name, county, lat, lon, price_kg, price_date, source in rows:
             market_data = {
-                "id": market.id,
-                "name": market.name,
-                "county": market.county,
-                "lat": market.lat,
-                "lon": market.lon,
+                "id": id_,
+                "name": name,
+                "county": county,
+                "lat": lat,
+                "lon": lon,
                 "latest_price": (
                     {
-                        "price_kg": latest_price.price_kg if latest_price else None,
-                        "date": latest_price.date.isoformat() if latest_price else None,
-                        "source": latest_price.source if latest_price else None,
+                        "price_kg": price_kg,
+                        "date": price_date.isoformat(),
+                        "source": source,
                     }
-                    if latest_price
+                    if price_date is not None
                     else None
                 ),
             }
@@ -1,14 +1,21 @@
-from pydantic import BaseModel, Field
-from typing import Dict, Optional
+from pydantic import BaseModel, ConfigDict, Field
+from typing import Dict, Literal, Optional
 from datetime import datetime
 
+# Request bodies are parsed once and only read afterwards
+REQUEST_MODEL_CONFIG = ConfigDict(extra="ignore", frozen=True)
+
 
 class AuthRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+
     username: str
     password: str
 
 
 class RefreshRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+
     refresh_token: str
 
 
@@ -29,8 +36,10 @@ class RefreshResponse(BaseModel):
 
 
 class EstimateRequest(BaseModel):
+    model_config = REQUEST_MODEL_CONFIG
+
     location: str
-    logistics_mode: str = Field(..., pattern=r"^(farmgate|wholesale|retail)$")
+    logistics_mode: Literal["farmgate", "wholesale", "retail"]
     variety_grade_factor: float = Field(1.0, ge=0.5, le=2.0)
     season_index: Optional[float] = Field(0.0, ge=-1.0, le=1.0)
     shock_index: Optional[float] = Field(0.0, ge=-1.0, le=1.0)
@@ -1,8 +1,14 @@
+import orjson
 import requests
-from datetime import datetime
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
 
 OPENWEATHER_URL = "https://api.openweathermap.org/data/3.0/onecall"
 
+# Shared keep-alive session so repeated fetches reuse TCP+TLS connections
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32))
+
 
 def fetch_weather_for(lat: float, lon: float, api_key: str) -> dict:
     params = {
@@ -12,22 +18,25 @@ def fetch_weather_for(lat: float, lon: float, api_key: str) -> dict:
         "units": "metric",
         "exclude": "minutely",  # keep payload small
     }
-    r = requests.get(OPENWEATHER_URL, params=params, timeout=10)
-    r.raise_for_status()
-    payload = r.json()
+    # Read the body as raw bytes straight into orjson (no decoded str copy) and
+    # hand the connection back to the pool as soon as it's consumed
+    with _SESSION.get(OPENWEATHER_URL, params=params, timeout=10, stream=True) as r:
+        r.raise_for_status()
+        payload = orjson.loads(b"".join(r.iter_content(16384)))
 
     current = payload.get("current", {})
     rain_mm = 0.0
     if isinstance(current.get("rain"), dict):
         rain_mm = current["rain"].get("1h", 0.0)
-    weather_code = current.get("weather", [{}])[0].get("id")
+    w_list = current.get("weather")
+    weather_code = w_list[0].get("id") if w_list else None
 
     # Simple normalization rule: heavy rain > 10mm -> index ~0.6+, extreme > 30mm -> ~1.0
     # Map rain_mm -> [0.0..1.0] with a soft cap
     weather_index = min(1.0, rain_mm / 30.0)
 
     return {
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
         "rain_mm": rain_mm,
         "weather_code": weather_code,
         "weather_index": weather_index,
@@ -1,83 +1,183 @@
 import os
-import json
+import orjson
+from bisect import bisect_left
+from collections import defaultdict
 import numpy as np
+from celery import group
+from sqlalchemy import delete, insert, select, update
 from .celery_app import celery_app
 from .extensions import db, get_redis
 from .models import Market, WeatherData, MarketPrice, ModelState
 from .services.weather_fetcher import fetch_weather_for
 from .estimator import estimate as estimator_fn
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
+DELETE_BATCH_SIZE = 10000
+
+
+def cache_many(entries, ttl):
+    """SETEX every (key, data) pair through a single pipelined round-trip"""
+    if not entries:
+        return
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for key, data in entries:
+            pipe.setex(key, ttl, orjson.dumps(data))
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Failed to cache {len(entries)} entries in Redis: {str(e)}")
+
 
 @celery_app.task
-def fetch_weather_data():
+def fetch_one_market(market_id):
     """
-    Periodic task to fetch weather data for all markets
+    Fetch and store current weather for a single market
     """
+    market = db.session.get(Market, market_id)
+    if market is None or market.lat is None or market.lon is None:
+        return {"market_id": market_id, "updated": False}
+
     try:
-        markets = (
-            db.session.query(Market)
-            .filter(Market.lat.isnot(None), Market.lon.isnot(None))
-            .all()
+        weather_payload = fetch_weather_for(
+            market.lat, market.lon, os.getenv("WEATHER_API_KEY")
         )
-        updated_count = 0
 
-        for market in markets:
-            try:
-                # Fetch weather data from OpenWeatherMap
-                weather_payload = fetch_weather_for(
-                    market.lat, market.lon, os.getenv("WEATHER_API_KEY")
-                )
+        # Store in database
+        weather_data = WeatherData(
+            market_id=market.id,
+            timestamp=datetime.utcnow(),
+            rain_mm=weather_payload["rain_mm"],
+            weather_code=str(weather_payload["weather_code"]),
+            weather_index=weather_payload["weather_index"],
+            raw=weather_payload,
+        )
+        db.session.add(weather_data)
+
+        # Cache latest weather in Redis for fast access
+        cache_data = {
+            "timestamp": weather_payload["timestamp"],
+            "rain_mm": weather_payload["rain_mm"],
+            "weather_index": weather_payload["weather_index"],
+            "weather_code": weather_payload["weather_code"],
+        }
+        cache_many([(f"weather:latest:{market.name}", cache_data)], 7200)  # 2 hour TTL
 
-                # Store in database
-                weather_data = WeatherData(
-                    market_id=market.id,
-                    timestamp=datetime.utcnow(),
-                    rain_mm=weather_payload["rain_mm"],
-                    weather_code=str(weather_payload["weather_code"]),
-                    weather_index=weather_payload["weather_index"],
-                    raw=weather_payload,
-                )
+        db.session.commit()
+        logger.info(f"Fetched weather data for market {market.name}")
+        return {"market_id": market_id, "updated": True}
 
-                db.session.add(weather_data)
+    except Exception as e:
+        logger.error(f"Failed to fetch weather for market {market.name}: {str(e)}")
+        db.session.rollback()
+        raise
 
-                # Cache latest weather in Redis for fast access
-                redis_client = get_redis()
-                cache_key = f"weather:latest:{market.name}"
-                cache_data = {
-                    "timestamp": weather_payload["timestamp"],
-                    "rain_mm": weather_payload["rain_mm"],
-                    "weather_index": weather_payload["weather_index"],
-                    "weather_code": weather_payload["weather_code"],
-                }
-                redis_client.setex(
-                    cache_key, 7200, json.dumps(cache_data)
-                )  # 2 hour TTL
 
-                updated_count += 1
-                logger.info(f"Fetched weather data for market {market.name}")
+@celery_app.task
+def fetch_weather_data():
+    """
+    Periodic task to fetch weather data for all markets, fanned out as one
+    subtask per market so workers run them in parallel and a failure only
+    retries its own market
+    """
+    try:
+        market_ids = (
+            db.session.execute(
+                select(Market.id).where(Market.lat.isnot(None), Market.lon.isnot(None))
+            )
+            .scalars()
+            .all()
+        )
 
-            except Exception as e:
-                logger.error(
-                    f"Failed to fetch weather for market {market.name}: {str(e)}"
-                )
-                continue
+        group(fetch_one_market.s(market_id) for market_id in market_ids).apply_async()
 
-        db.session.commit()
-        logger.info(
-            f"Successfully updated weather data for {updated_count}/{len(markets)} markets"
-        )
-        return {"updated_markets": updated_count, "total_markets": len(markets)}
+        logger.info(f"Dispatched weather fetches for {len(market_ids)} markets")
+        return {"dispatched_markets": len(market_ids)}
 
     except Exception as e:
-        logger.error(f"Failed to fetch weather data: {str(e)}")
-        db.session.rollback()
+        logger.error(f"Failed to dispatch weather fetches: {str(e)}")
         raise
 
 
+def upsert_model_states(values: dict):
+    """Write ModelState rows with one executemany UPDATE plus one INSERT for new keys"""
+    if not values:
+        return
+    existing = set(
+        db.session.execute(
+            select(ModelState.key).where(ModelState.key.in_(values))
+        ).scalars()
+    )
+    updates = [{"key": k, "value": v} for k, v in values.items() if k in existing]
+    inserts = [{"key": k, "value": v} for k, v in values.items() if k not in existing]
+    if updates:
+        db.session.execute(update(ModelState), updates)
+    if inserts:
+        db.session.execute(insert(ModelState), inserts)
+
+
+def _collect_residual_samples(
+    location,
+    markets,
+    distances,
+    price_dates,
+    prices_by_day,
+    weather,
+    prev_base,
+    actual,
+    estimated,
+):
+    """
+    Fill actual/estimated with one sample per usable day for a location and
+    return how many samples were written
+    """
+    weather_times = [timestamp for timestamp, _ in weather]
+    n = 0
+    for price_date in price_dates:  # Last 30 days
+        day_prices = prices_by_day.get(price_date.date(), {})
+
+        # Get actual price for the location on this date
+        actual_price = day_prices.get(location)
+        if actual_price is None:
+            continue
+
+        # Get market prices for estimation
+        prices_now = {m: day_prices[m] for m in markets if m in day_prices}
+
+        if len(prices_now) < 2:  # Need at least 2 market prices
+            continue
+
+        # Weather for this date: first reading in the 24h window
+        i = bisect_left(weather_times, price_date)
+        in_window = i < len(weather_times) and weather_times[
+            i
+        ] < price_date + timedelta(days=1)
+        weather_index = weather[i][1] if in_window else 0.0
+
+        # Compute estimate
+        try:
+            p_hat, _, _ = estimator_fn(
+                prices_now=prices_now,
+                distances=distances,
+                prev_base=prev_base,
+                weather_index=weather_index,
+            )
+
+            actual[n] = actual_price
+            estimated[n] = p_hat
+            n += 1
+
+        except Exception as e:
+            logger.warning(
+                f"Failed to compute estimate for {location} on {price_date}: {e}"
+            )
+            continue
+
+    return n
+
+
 @celery_app.task
 def compute_price_residuals():
     """
@@ -85,148 +185,125 @@ def compute_price_residuals():
     """
     try:
         locations = ["Nairobi", "Nakuru", "Nyeri", "Mombasa", "Eldoret"]
+        markets = ["Nairobi", "Nakuru", "Nyeri"]  # Core markets for estimation
+        distances = {
+            "Nairobi": 100,
+            "Nakuru": 80,
+            "Nyeri": 60,
+        }  # Simplified
         updated_sigmas = {}
 
-        for location in locations:
-            try:
-                # Get recent price data (last 30 days)
-
-                # Get actual prices
-                actual_prices = []
-                estimated_prices = []
-
-                # Query market prices for this location and nearby markets
-                markets = ["Nairobi", "Nakuru", "Nyeri"]  # Core markets for estimation
-
-                for days_ago in range(1, 31):  # Last 30 days
-                    price_date = datetime.utcnow() - timedelta(days=days_ago)
-
-                    # Get actual price for the location on this date
-                    market = db.session.query(Market).filter_by(name=location).first()
-                    if not market:
-                        continue
-
-                    actual_price_record = (
-                        db.session.query(MarketPrice)
-                        .filter(MarketPrice.market_id == market.id)
-                        .filter(MarketPrice.date >= price_date.date())
-                        .filter(
-                            MarketPrice.date < (price_date + timedelta(days=1)).date()
-                        )
-                        .first()
-                    )
+        now = datetime.utcnow()
+        price_dates = [now - timedelta(days=days_ago) for days_ago in range(1, 31)]
 
-                    if not actual_price_record:
-                        continue
-
-                    # Get market prices for estimation
-                    prices_now = {}
-                    distances = {
-                        "Nairobi": 100,
-                        "Nakuru": 80,
-                        "Nyeri": 60,
-                    }  # Simplified
-
-                    for m in markets:
-                        mp = (
-                            db.session.query(MarketPrice)
-                            .join(Market, Market.id == MarketPrice.market_id)
-                            .filter(Market.name == m)
-                            .filter(MarketPrice.date >= price_date.date())
-                            .filter(
-                                MarketPrice.date
-                                < (price_date + timedelta(days=1)).date()
-                            )
-                            .first()
-                        )
-                        if mp:
-                            prices_now[m] = mp.price_kg
-
-                    if len(prices_now) < 2:  # Need at least 2 market prices
-                        continue
-
-                    # Get weather data for this date
-                    weather_data = (
-                        db.session.query(WeatherData)
-                        .filter(WeatherData.market_id == market.id)
-                        .filter(WeatherData.timestamp >= price_date)
-                        .filter(WeatherData.timestamp < price_date + timedelta(days=1))
-                        .first()
-                    )
+        # Per-day actual/estimated buffers, reused across locations
+        actual = np.empty(len(price_dates), dtype=np.float64)
+        estimated = np.empty(len(price_dates), dtype=np.float64)
+
+        markets_by_name = {
+            m.name: m
+            for m in db.session.query(Market).filter(Market.name.in_(locations))
+        }
 
-                    weather_index = weather_data.weather_index if weather_data else 0.0
+        # Load the last 30 days of prices for every market involved in one query,
+        # keeping the first price seen per market per day
+        window_start = datetime.combine(price_dates[-1].date(), time.min)
+        window_end = datetime.combine(now.date(), time.min)
+        rows = db.session.execute(
+            select(Market.name, MarketPrice.date, MarketPrice.price_kg)
+            .join(Market, Market.id == MarketPrice.market_id)
+            .where(
+                Market.name.in_(set(locations) | set(markets)),
+                MarketPrice.date >= window_start,
+                MarketPrice.date < window_end,
+            )
+            .order_by(MarketPrice.date, MarketPrice.id)
+        ).all()
+        prices_by_day = defaultdict(dict)
+        for name, price_date, price_kg in rows:
+            prices_by_day[price_date.date()].setdefault(name, price_kg)
+
+        # The per-location weather readings and previous bases, one query each
+        location_ids = {m.id: name for name, m in markets_by_name.items()}
+        weather_by_location = defaultdict(list)
+        prev_bases = {}
+        with db.session.no_autoflush:
+            weather_rows = db.session.execute(
+                select(
+                    WeatherData.market_id,
+                    WeatherData.timestamp,
+                    WeatherData.weather_index,
+                )
+                .where(
+                    WeatherData.market_id.in_(location_ids),
+                    WeatherData.timestamp >= price_dates[-1],
+                    WeatherData.timestamp < now,
+                )
+                .order_by(WeatherData.market_id, WeatherData.timestamp)
+            )
+            for market_id, timestamp, weather_index in weather_rows:
+                weather_by_location[location_ids[market_id]].append(
+                    (timestamp, weather_index)
+                )
 
-                    # Get previous base
-                    prev_base = None
-                    state = (
-                        db.session.query(ModelState)
-                        .filter_by(key=f"base:{location}")
-                        .first()
+            state_rows = db.session.execute(
+                select(ModelState.key, ModelState.value).where(
+                    ModelState.key.in_([f"base:{loc}" for loc in locations])
+                )
+            )
+            for key, value in state_rows:
+                if value:
+                    prev_bases[key.removeprefix("base:")] = value.get("base")
+
+        # Everything is in memory now; the rest is pure computation
+        for location in locations:
+            try:
+                n = 0
+                if location in markets_by_name:
+                    n = _collect_residual_samples(
+                        location,
+                        markets,
+                        distances,
+                        price_dates,
+                        prices_by_day,
+                        weather_by_location[location],
+                        prev_bases.get(location),
+                        actual,
+                        estimated,
                     )
-                    if state:
-                        prev_base = state.value.get("base")
-
-                    # Compute estimate
-                    try:
-                        p_hat, _, _ = estimator_fn(
-                            prices_now=prices_now,
-                            distances=distances,
-                            prev_base=prev_base,
-                            weather_index=weather_index,
-                        )
-
-                        actual_prices.append(actual_price_record.price_kg)
-                        estimated_prices.append(p_hat)
-
-                    except Exception as e:
-                        logger.warning(
-                            f"Failed to compute estimate for {location} on {price_date}: {e}"
-                        )
-                        continue
 
                 # Compute residual standard deviation
-                if len(actual_prices) >= 10:  # Need sufficient data
-                    residuals = np.array(actual_prices) - np.array(estimated_prices)
-                    sigma = float(np.std(residuals))
-
-                    # Store sigma in ModelState
-                    sigma_state = (
-                        db.session.query(ModelState)
-                        .filter_by(key=f"sigma:{location}")
-                        .first()
-                    )
-                    if sigma_state:
-                        sigma_state.value = {
-                            "sigma": sigma,
-                            "last_updated": datetime.utcnow().isoformat(),
-                        }
-                    else:
-                        sigma_state = ModelState(
-                            key=f"sigma:{location}",
-                            value={
-                                "sigma": sigma,
-                                "last_updated": datetime.utcnow().isoformat(),
-                            },
-                        )
-                        db.session.add(sigma_state)
-
-                    # Cache in Redis
-                    redis_client = get_redis()
-                    redis_client.setex(
-                        f"sigma:{location}", 86400, json.dumps({"sigma": sigma})
-                    )  # 24h TTL
+                if n >= 10:  # Need sufficient data
+                    residuals = actual[:n] - estimated[:n]
+                    sigma = float(residuals.std())
 
                     updated_sigmas[location] = sigma
                     logger.info(f"Updated sigma for {location}: {sigma:.3f}")
                 else:
-                    logger.warning(
-                        f"Insufficient data for {location}: {len(actual_prices)} samples"
-                    )
+                    logger.warning(f"Insufficient data for {location}: {n} samples")
 
             except Exception as e:
                 logger.error(f"Failed to compute sigma for {location}: {str(e)}")
                 continue
 
+        # Cache in Redis
+        cache_many(
+            [
+                (f"sigma:{loc}", {"sigma": sigma})
+                for loc, sigma in updated_sigmas.items()
+            ],
+            86400,
+        )  # 24h TTL
+
+        # Store all sigmas in ModelState in one batch
+        last_updated = datetime.utcnow().isoformat()
+        upsert_model_states(
+            {
+                f"sigma:{location}": {"sigma": sigma, "last_updated": last_updated}
+                for location, sigma in updated_sigmas.items()
+            }
+        )
+
         db.session.commit()
         logger.info(f"Successfully updated sigma for {len(updated_sigmas)} locations")
         return {
@@ -248,13 +325,24 @@ def clear_old_weather_data():
     try:
         cutoff_date = datetime.utcnow() - timedelta(days=90)
 
-        deleted_count = (
-            db.session.query(WeatherData)
-            .filter(WeatherData.timestamp < cutoff_date)
-            .delete()
-        )
+        # Delete in bounded batches, committing each, so no single long
+        # transaction holds locks on the table the fetch tasks write to
+        deleted_count = 0
+        while True:
+            batch = (
+                select(WeatherData.id)
+                .where(WeatherData.timestamp < cutoff_date)
+                .limit(DELETE_BATCH_SIZE)
+            )
+            result = db.session.execute(
+                delete(WeatherData).where(WeatherData.id.in_(batch)),
+                execution_options={"synchronize_session": False},
+            )
+            db.session.commit()
+            deleted_count += result.rowcount
+            if result.rowcount < DELETE_BATCH_SIZE:
+                break
 
-        db.session.commit()
         logger.info(f"Cleaned up {deleted_count} old weather records")
         return {"deleted_records": deleted_count}
 
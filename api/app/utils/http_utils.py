@@ -0,0 +1,18 @@
+import hashlib
+from flask import request, make_response
+
+
+def etag_json_response(body, cache_control: str = "private, max-age=300"):
+    """Return a JSON body with an ETag, or an empty 304 if the client already has it"""
+    if isinstance(body, str):
+        body = body.encode()
+    etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+
+    if request.if_none_match.contains(etag):
+        resp = make_response("", 304)
+    else:
+        resp = make_response(body, 200)
+        resp.content_type = "application/json"
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
@@ -0,0 +1,36 @@
+import orjson
+from flask.json.provider import DefaultJSONProvider, JSONProvider
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson, used by jsonify and request.get_json
+
+    Honours ``sort_keys`` and ``default`` like Flask's default provider; other
+    json.dumps options (indent, separators, ensure_ascii) are dropped, and
+    dates/datetimes are written by orjson as RFC 3339 rather than HTTP dates.
+    """
+
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+    sort_keys = True
+    default = staticmethod(DefaultJSONProvider.default)
+
+    def _dumps(self, obj, sort_keys, default):
+        option = self.option | orjson.OPT_SORT_KEYS if sort_keys else self.option
+        return orjson.dumps(obj, default=default, option=option)
+
+    def dumps(self, obj, **kwargs):
+        return self._dumps(
+            obj,
+            kwargs.get("sort_keys", self.sort_keys),
+            kwargs.get("default", self.default),
+        ).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            self._dumps(obj, self.sort_keys, self.default),
+            mimetype="application/json",
+        )
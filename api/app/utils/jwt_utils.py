@@ -1,15 +1,48 @@
 import os
 import time
+import base64
+import hashlib
+import hmac
+from functools import lru_cache
 import jwt
+import orjson
 from datetime import datetime, timezone, timedelta
 
 JWT_SECRET = os.getenv("JWT_SECRET")
+# HS256 signs via stdlib hmac/hashlib, which is already OpenSSL-backed (SHA-NI/AVX2)
 JWT_ALG = "HS256"
 JWT_EXP_SECONDS = int(os.getenv("JWT_EXP_SECONDS", "900"))  # default 15m
 REFRESH_TOKEN_EXP_DAYS = int(
     os.getenv("REFRESH_TOKEN_EXP_DAYS", "30")
 )  # default 30 days
 
+# Tokens are minted by hand: the header never changes, so it's encoded once
+_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+_KEY = JWT_SECRET.encode() if JWT_SECRET else None
+
+# Decode arguments are fixed, so build them once rather than per verification
+_ALGORITHMS = [JWT_ALG]
+_ACCESS_DECODE_OPTIONS = {"require": ["exp", "iat", "sub"]}
+_REFRESH_DECODE_OPTIONS = {"require": ["exp", "iat", "sub", "jti"]}
+
+
+def _encode(payload: dict) -> str:
+    """Sign an HS256 JWT; PyJWT is still used to decode and validate"""
+    if _KEY is None:
+        raise RuntimeError("JWT_SECRET is not set")
+    body = base64.urlsafe_b64encode(orjson.dumps(payload)).rstrip(b"=")
+    signing_input = _HEADER_B64 + b"." + body
+    signature = base64.urlsafe_b64encode(
+        hmac.new(_KEY, signing_input, hashlib.sha256).digest()
+    ).rstrip(b"=")
+    return (signing_input + b"." + signature).decode()
+
+
+# Claims that are the same on every token of a kind
+_ACCESS_TEMPLATE = {"iss": "potato-price-api", "type": "access"}
+_REFRESH_TEMPLATE = {"iss": "potato-price-api", "type": "refresh"}
+_REFRESH_EXP_SECONDS = REFRESH_TOKEN_EXP_DAYS * 24 * 60 * 60
+
 
 def create_access_token(sub: str, extra_claims: dict | None = None):
     now = int(time.time())
@@ -17,13 +50,11 @@ def create_access_token(sub: str, extra_claims: dict | None = None):
         "sub": str(sub),
         "iat": now,
         "exp": now + JWT_EXP_SECONDS,
-        "iss": "potato-price-api",
-        "type": "access",
+        **_ACCESS_TEMPLATE,
     }
     if extra_claims:
         payload.update(extra_claims)
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
-    return token
+    return _encode(payload)
 
 
 def create_refresh_token_jwt(sub: str, refresh_token_id: str):
@@ -32,33 +63,35 @@ def create_refresh_token_jwt(sub: str, refresh_token_id: str):
     payload = {
         "sub": str(sub),
         "iat": now,
-        "exp": now + (REFRESH_TOKEN_EXP_DAYS * 24 * 60 * 60),  # Convert days to seconds
-        "iss": "potato-price-api",
-        "type": "refresh",
+        "exp": now + _REFRESH_EXP_SECONDS,
+        **_REFRESH_TEMPLATE,
         "jti": refresh_token_id,  # JWT ID points to the refresh token in DB
     }
-    token = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
-    return token
+    return _encode(payload)
 
 
-def decode_access_token(token: str):
+@lru_cache(maxsize=4096)
+def _decode_access(token: str) -> dict:
+    """Verify an access token once; failures raise and are never cached"""
     payload = jwt.decode(
-        token,
-        JWT_SECRET,
-        algorithms=[JWT_ALG],
-        options={"require": ["exp", "iat", "sub"]},
+        token, _KEY, algorithms=_ALGORITHMS, options=_ACCESS_DECODE_OPTIONS
     )
     if payload.get("type") != "access":
         raise jwt.InvalidTokenError("Invalid token type")
     return payload
 
 
+def decode_access_token(token: str):
+    payload = _decode_access(token)
+    # a cached verification can outlive the token itself
+    if payload["exp"] <= time.time():
+        raise jwt.ExpiredSignatureError("Signature has expired")
+    return dict(payload)
+
+
 def decode_refresh_token(token: str):
     payload = jwt.decode(
-        token,
-        JWT_SECRET,
-        algorithms=[JWT_ALG],
-        options={"require": ["exp", "iat", "sub", "jti"]},
+        token, _KEY, algorithms=_ALGORITHMS, options=_REFRESH_DECODE_OPTIONS
     )
     if payload.get("type") != "refresh":
         raise jwt.InvalidTokenError("Invalid token type")
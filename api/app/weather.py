@@ -1,16 +1,70 @@
-import json
+import threading
+import orjson
+from cachetools import TTLCache
 from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import func, select
 from .extensions import db, get_redis, limiter
 from .models import Market, WeatherData
 from .services.weather_fetcher import fetch_weather_for
+from .utils.http_utils import etag_json_response
 from datetime import datetime, timedelta
 
 weather_bp = Blueprint("weather", __name__)
 
+# Weather isn't per-user, so shared caches may keep it too
+WEATHER_CACHE_CONTROL = "public, max-age=300"
+
+
+@weather_bp.record_once
+def init_market_location_cache(state):
+    """Per-app cache of market coordinates; entries expire so edits show up"""
+    state.app.extensions["market_location_cache"] = (
+        TTLCache(maxsize=64, ttl=300),
+        threading.Lock(),
+    )
+
+
+def clear_market_location_cache():
+    """Drop this app's cached market coordinates; other processes rely on the TTL"""
+    cache, lock = current_app.extensions["market_location_cache"]
+    with lock:
+        cache.clear()
+
+
+def market_location(name: str) -> tuple[int, float | None, float | None]:
+    """(id, lat, lon) of a market by name; unknown names raise and aren't cached"""
+    cache, lock = current_app.extensions["market_location_cache"]
+    with lock:
+        location = cache.get(name)
+    if location is not None:
+        return location
+
+    row = db.session.execute(
+        select(Market.id, Market.lat, Market.lon).where(Market.name == name)
+    ).first()
+    if row is None:
+        raise LookupError(name)
+    location = tuple(row)
+    with lock:
+        cache[name] = location
+    return location
+
 
 @weather_bp.route("/latest", methods=["GET"])
 @limiter.limit("60 per minute")  # Rate limit weather requests
 def latest_weather():
+    locations = request.args.get("locations")
+    if locations is not None:
+        names = list(
+            dict.fromkeys(n.strip() for n in locations.split(",") if n.strip())
+        )
+        if not names:
+            return jsonify({"error": "missing_location"}), 400
+        return etag_json_response(
+            orjson.dumps({"locations": latest_weather_many(names)}),
+            WEATHER_CACHE_CONTROL,
+        )
+
     location = request.args.get("location")
     if not location:
         return jsonify({"error": "missing_location"}), 400
@@ -20,9 +74,9 @@ def latest_weather():
     try:
         cached_weather = redis_client.get(f"weather:latest:{location}")
         if cached_weather:
-            weather_data = json.loads(cached_weather)
-            return (
-                jsonify(
+            weather_data = orjson.loads(cached_weather)
+            return etag_json_response(
+                orjson.dumps(
                     {
                         "timestamp": weather_data["timestamp"],
                         "rain_mm": weather_data["rain_mm"],
@@ -31,30 +85,29 @@ def latest_weather():
                         "source": "cache",
                     }
                 ),
-                200,
+                WEATHER_CACHE_CONTROL,
             )
     except Exception:
         pass  # Continue to database/API fallback
 
-    m = db.session.query(Market).filter_by(name=location).first()
-    if not m:
+    try:
+        market_id, lat, lon = market_location(location)
+    except LookupError:
         return jsonify({"error": "unknown_location"}), 404
 
     # return latest weather data from database
     w = (
         db.session.query(WeatherData)
-        .filter(WeatherData.market_id == m.id)
+        .filter(WeatherData.market_id == market_id)
         .order_by(WeatherData.timestamp.desc())
         .first()
     )
     if not w:
         # fetch on demand (synchronous) — uses OpenWeatherMap; careful with rate limits
         try:
-            payload = fetch_weather_for(
-                m.lat, m.lon, current_app.config["WEATHER_API_KEY"]
-            )
+            payload = fetch_weather_for(lat, lon, current_app.config["WEATHER_API_KEY"])
             wd = WeatherData(
-                market_id=m.id,
+                market_id=market_id,
                 timestamp=datetime.utcnow(),
                 rain_mm=payload["rain_mm"],
                 weather_code=str(payload["weather_code"]),
@@ -73,17 +126,20 @@ def latest_weather():
             }
             try:
                 redis_client.setex(
-                    f"weather:latest:{location}", 7200, json.dumps(cache_data)
+                    f"weather:latest:{location}", 7200, orjson.dumps(cache_data)
                 )
             except Exception:
                 pass
 
-            return jsonify({"weather": payload, "source": "api"}), 200
+            return etag_json_response(
+                orjson.dumps({"weather": payload, "source": "api"}),
+                WEATHER_CACHE_CONTROL,
+            )
         except Exception as e:
             return jsonify({"error": "fetch_error", "details": str(e)}), 500
 
-    return (
-        jsonify(
+    return etag_json_response(
+        orjson.dumps(
             {
                 "timestamp": w.timestamp.isoformat(),
                 "rain_mm": w.rain_mm,
@@ -93,10 +149,67 @@ def latest_weather():
                 "source": "database",
             }
         ),
-        200,
+        WEATHER_CACHE_CONTROL,
     )
 
 
+def latest_weather_many(names):
+    """Latest weather for several markets: one MGET, then one SQL query for misses"""
+    results = dict.fromkeys(names)
+    misses = list(names)
+    try:
+        cached = get_redis().mget([f"weather:latest:{name}" for name in names])
+        misses = []
+        for name, value in zip(names, cached):
+            if value:
+                results[name] = {**orjson.loads(value), "source": "cache"}
+            else:
+                misses.append(name)
+    except Exception:
+        pass  # Fall back to the database for every location
+
+    if misses:
+        ranked = (
+            select(
+                WeatherData.market_id,
+                WeatherData.timestamp,
+                WeatherData.rain_mm,
+                WeatherData.weather_index,
+                WeatherData.weather_code,
+                func.row_number()
+                .over(
+                    partition_by=WeatherData.market_id,
+                    order_by=WeatherData.timestamp.desc(),
+                )
+                .label("rn"),
+            )
+            .join(Market, Market.id == WeatherData.market_id)
+            .where(Market.name.in_(misses))
+            .subquery()
+        )
+        rows = db.session.execute(
+            select(
+                Market.name,
+                ranked.c.timestamp,
+                ranked.c.rain_mm,
+                ranked.c.weather_index,
+                ranked.c.weather_code,
+            )
+            .join(ranked, ranked.c.market_id == Market.id)
+            .where(ranked.c.rn == 1)
+        )
+        for name, timestamp, rain_mm, weather_index, weather_code in rows:
+            results[name] = {
+                "timestamp": timestamp.isoformat(),
+                "rain_mm": rain_mm,
+                "weather_index": weather_index,
+                "weather_code": weather_code,
+                "source": "database",
+            }
+
+    return results
+
+
 @weather_bp.route("/history", methods=["GET"])
 @limiter.limit("30 per minute")
 def weather_history():
@@ -110,15 +223,16 @@ def weather_history():
     if days > 30:
         return jsonify({"error": "max_30_days"}), 400
 
-    m = db.session.query(Market).filter_by(name=location).first()
-    if not m:
+    try:
+        market_id, _, _ = market_location(location)
+    except LookupError:
         return jsonify({"error": "unknown_location"}), 404
 
     # Get historical weather data
     cutoff_date = datetime.utcnow() - timedelta(days=days)
     weather_records = (
         db.session.query(WeatherData)
-        .filter(WeatherData.market_id == m.id)
+        .filter(WeatherData.market_id == market_id)
         .filter(WeatherData.timestamp >= cutoff_date)
         .order_by(WeatherData.timestamp.desc())
         .limit(days * 4)  # Allow for multiple records per day
@@ -0,0 +1,31 @@
+"""Add partial index on active refresh tokens
+
+Revision ID: b7d3e9f1a2c4
+Revises: 8619a01a034e
+Create Date: 2026-10-14 09:12:41.318204
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "b7d3e9f1a2c4"
+down_revision = "8619a01a034e"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("refresh_tokens", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_refresh_tokens_active_user",
+            ["user_id"],
+            unique=False,
+            postgresql_where=sa.text("revoked_at IS NULL"),
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("refresh_tokens", schema=None) as batch_op:
+        batch_op.drop_index("ix_refresh_tokens_active_user")
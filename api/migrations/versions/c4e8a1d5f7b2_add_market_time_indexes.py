@@ -0,0 +1,35 @@
+"""Add composite market/time indexes on prices and weather
+
+Revision ID: c4e8a1d5f7b2
+Revises: b7d3e9f1a2c4
+Create Date: 2026-10-14 11:04:27.552913
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c4e8a1d5f7b2"
+down_revision = "b7d3e9f1a2c4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("market_prices", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_market_prices_market_date", ["market_id", "date"], unique=False
+        )
+
+    with op.batch_alter_table("weather_data", schema=None) as batch_op:
+        batch_op.create_index(
+            "ix_weather_data_market_ts", ["market_id", "timestamp"], unique=False
+        )
+
+
+def downgrade():
+    with op.batch_alter_table("weather_data", schema=None) as batch_op:
+        batch_op.drop_index("ix_weather_data_market_ts")
+
+    with op.batch_alter_table("market_prices", schema=None) as batch_op:
+        batch_op.drop_index("ix_market_prices_market_date")
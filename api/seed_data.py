@@ -2,6 +2,7 @@
 """
 Script to seed the database with initial market and sample price data
 """
+
 import os
 import sys
 from datetime import datetime, timedelta, timezone
@@ -13,7 +14,9 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from app.main import create_app
 from app.extensions import db
 from app.models import Market, MarketPrice, User
-from passlib.hash import bcrypt
+from app.auth import hash_password
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 
 def seed_markets():
@@ -61,12 +64,18 @@ def seed_markets():
         },
     ]
 
-    for market_data in markets_data:
-        existing = Market.query.filter_by(name=market_data["name"]).first()
-        if not existing:
-            market = Market(**market_data)
-            db.session.add(market)
-            print(f"Added market: {market_data['name']}")
+    # One atomic INSERT that skips markets that already exist
+    dialect_insert = {"postgresql": pg_insert, "sqlite": sqlite_insert}[
+        db.engine.dialect.name
+    ]
+    stmt = (
+        dialect_insert(Market)
+        .values(markets_data)
+        .on_conflict_do_nothing(index_elements=["name"])
+        .returning(Market.name)
+    )
+    for name in db.session.execute(stmt).scalars():
+        print(f"Added market: {name}")
 
     db.session.commit()
 
@@ -84,29 +93,38 @@ def seed_sample_prices():
         "Eldoret": 85.0,
     }
 
+    # One query for every (market, day) that already has a price
+    existing = {
+        (market_id, date.date())
+        for market_id, date in db.session.query(MarketPrice.market_id, MarketPrice.date)
+    }
+
     # Generate prices for last 30 days
+    now = datetime.now(timezone.utc)
+    rows = []
     for market in markets:
         base_price = base_prices.get(market.name, 90.0)
 
         for days_ago in range(30, 0, -1):
-            date = datetime.now(timezone.utc) - timedelta(days=days_ago)
+            date = now - timedelta(days=days_ago)
 
             # Add some random variation (±15%)
             variation = random.uniform(0.85, 1.15)
             price = round(base_price * variation, 2)
 
-            existing = MarketPrice.query.filter_by(
-                market_id=market.id, date=date.date()
-            ).first()
-
-            if not existing:
-                market_price = MarketPrice(
-                    market_id=market.id, date=date, price_kg=price, source="seed_data"
+            if (market.id, date.date()) not in existing:
+                rows.append(
+                    MarketPrice(
+                        market_id=market.id,
+                        date=date,
+                        price_kg=price,
+                        source="seed_data",
+                    )
                 )
-                db.session.add(market_price)
 
         print(f"Added sample prices for: {market.name}")
 
+    db.session.bulk_save_objects(rows)
     db.session.commit()
 
 
@@ -118,7 +136,7 @@ def seed_admin_user():
     existing = User.query.filter_by(username=username).first()
     if not existing:
         user = User(
-            username=username, password_hash=bcrypt.hash(password), role="admin"
+            username=username, password_hash=hash_password(password), role="admin"
         )
         db.session.add(user)
         db.session.commit()
@@ -1,9 +1,9 @@
 import pytest
 import os
-import tempfile
 import warnings
 from app.main import create_app
 from app.extensions import db
+from app.weather import clear_market_location_cache
 
 # Set test environment variables
 os.environ["JWT_SECRET"] = "test-jwt-secret"
@@ -32,22 +32,25 @@ def suppress_warnings():
 @pytest.fixture(scope="session")
 def app():
     """Create application for the tests."""
-    # Create a temporary database
-    db_fd, db_path = tempfile.mkstemp()
-
+    # TestingConfig already uses a shared in-memory SQLite database
     app = create_app("testing")
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{db_path}"
-    app.config["TESTING"] = True
-    app.config["WTF_CSRF_ENABLED"] = False
 
     with app.app_context():
         db.create_all()
         yield app
         db.drop_all()
 
-    # Clean up
-    os.close(db_fd)
-    os.unlink(db_path)
+
+# The schema comes from the session-scoped ``app``; emptying the tables after
+# each test is much cheaper than re-running create_all/drop_all
+@pytest.fixture
+def clean_tables(app):
+    yield
+    db.session.remove()
+    for table in reversed(db.metadata.sorted_tables):
+        db.session.execute(table.delete())
+    db.session.commit()
+    clear_market_location_cache()
 
 
 @pytest.fixture
@@ -3,10 +3,13 @@ import json
 from app.main import create_app
 from app.extensions import db
 from app.models import User
+from app import auth
 
 
 @pytest.fixture
-def app():
+def app(monkeypatch):
+    # Minimum bcrypt cost keeps hashing from dominating the auth tests
+    monkeypatch.setattr(auth, "BCRYPT_ROUNDS", 4)
     app = create_app("testing")
     with app.app_context():
         db.create_all()
@@ -50,11 +53,11 @@ class TestAuth:
         assert data["error"] == "user_exists"
 
     def test_login_success(self, client, app):
-        from passlib.hash import bcrypt  # Use bcrypt instead of argon2
-
         # Create user first
         with app.app_context():
-            user = User(username="testuser", password_hash=bcrypt.hash("testpass123"))
+            user = User(
+                username="testuser", password_hash=auth.hash_password("testpass123")
+            )
             db.session.add(user)
             db.session.commit()
 
@@ -95,3 +98,78 @@ class TestAuth:
         assert response.status_code == 400
         data = json.loads(response.data)
         assert data["error"] == "invalid_payload"
+
+    def test_refresh_rotates_token(self, client, app):
+        with app.app_context():
+            user = User(
+                username="testuser", password_hash=auth.hash_password("testpass123")
+            )
+            db.session.add(user)
+            db.session.commit()
+
+        response = client.post(
+            "/auth/login",
+            data=json.dumps({"username": "testuser", "password": "testpass123"}),
+            content_type="application/json",
+        )
+        refresh_token = json.loads(response.data)["refresh_token"]
+
+        response = client.post(
+            "/auth/refresh",
+            data=json.dumps({"refresh_token": refresh_token}),
+            content_type="application/json",
+        )
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data["refresh_token"] != refresh_token
+
+        # The rotated-out token can't be used again
+        response = client.post(
+            "/auth/refresh",
+            data=json.dumps({"refresh_token": refresh_token}),
+            content_type="application/json",
+        )
+        assert response.status_code == 401
+        assert json.loads(response.data)["error"] == "invalid_refresh_token"
+
+    def test_revoke_all(self, client, app):
+        with app.app_context():
+            user = User(
+                username="testuser", password_hash=auth.hash_password("testpass123")
+            )
+            db.session.add(user)
+            db.session.commit()
+
+        credentials = json.dumps({"username": "testuser", "password": "testpass123"})
+        for _ in range(2):
+            response = client.post(
+                "/auth/login", data=credentials, content_type="application/json"
+            )
+        access_token = json.loads(response.data)["access_token"]
+
+        response = client.post(
+            "/auth/revoke-all", headers={"Authorization": f"Bearer {access_token}"}
+        )
+        assert response.status_code == 200
+        assert json.loads(response.data)["message"] == "Revoked 2 tokens"
+
+    def test_cached_access_token_expires(self, client, app, monkeypatch):
+        import time
+        from types import SimpleNamespace
+        from app.utils import jwt_utils
+
+        with app.app_context():
+            user = User(username="testuser", password_hash="dummy")
+            db.session.add(user)
+            db.session.commit()
+            token = jwt_utils.create_access_token(sub=user.id)
+
+        headers = {"Authorization": f"Bearer {token}"}
+        assert jwt_utils.decode_access_token(token)["sub"] == "1"
+
+        # The verification is cached, but the token must still expire on time
+        later = time.time() + jwt_utils.JWT_EXP_SECONDS + 1
+        monkeypatch.setattr(jwt_utils, "time", SimpleNamespace(time=lambda: later))
+        response = client.post("/auth/revoke-all", headers=headers)
+        assert response.status_code == 401
+        assert json.loads(response.data)["details"] == "Signature has expired"
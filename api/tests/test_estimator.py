@@ -1,5 +1,9 @@
 from app.estimator import distance_weighted_base, ewma, estimate
 
+# Single market at zero distance, so the base is exactly its price
+SINGLE_MARKET_PRICES = {"Nairobi": 100.0}
+SINGLE_MARKET_DISTANCES = {"Nairobi": 0.0}
+
 
 class TestEstimator:
     def test_distance_weighted_base(self):
@@ -66,18 +70,15 @@ class TestEstimator:
         assert explain_high["weather_mult"] > explain_normal["weather_mult"]
 
     def test_logistics_modes(self):
-        prices_now = {"Nairobi": 100.0}
-        distances = {"Nairobi": 0.0}
-
-        farmgate, _, explain_fg = estimate(
-            prices_now, distances, None, logistics_mode="farmgate"
-        )
-        wholesale, _, explain_ws = estimate(
-            prices_now, distances, None, logistics_mode="wholesale"
-        )
-        retail, _, explain_rt = estimate(
-            prices_now, distances, None, logistics_mode="retail"
-        )
+        results = {
+            mode: estimate(
+                SINGLE_MARKET_PRICES, SINGLE_MARKET_DISTANCES, None, logistics_mode=mode
+            )
+            for mode in ("farmgate", "wholesale", "retail")
+        }
+        farmgate, _, explain_fg = results["farmgate"]
+        wholesale, _, explain_ws = results["wholesale"]
+        retail, _, explain_rt = results["retail"]
 
         # Farmgate < Wholesale < Retail
         assert farmgate < wholesale < retail
@@ -86,19 +87,39 @@ class TestEstimator:
         assert explain_rt["logistics_mult"] == 1.20
 
     def test_season_impact(self):
-        prices_now = {"Nairobi": 100.0}
-        distances = {"Nairobi": 0.0}
-
         # Negative season index (abundant season)
         abundant, _, explain_abundant = estimate(
-            prices_now, distances, None, season_index=-0.5
+            SINGLE_MARKET_PRICES, SINGLE_MARKET_DISTANCES, None, season_index=-0.5
         )
 
         # Positive season index (scarce season)
         scarce, _, explain_scarce = estimate(
-            prices_now, distances, None, season_index=0.5
+            SINGLE_MARKET_PRICES, SINGLE_MARKET_DISTANCES, None, season_index=0.5
         )
 
         # Scarce season should have higher prices
         assert scarce > abundant
         assert explain_scarce["season_mult"] > explain_abundant["season_mult"]
+
+    def test_indices_are_clamped(self):
+        def mults(**indices):
+            _, _, explain = estimate(
+                SINGLE_MARKET_PRICES, SINGLE_MARKET_DISTANCES, None, **indices
+            )
+            return (
+                explain["season_mult"],
+                explain["shock_mult"],
+                explain["weather_mult"],
+            )
+
+        assert mults(season_index=3.0, shock_index=-3.0, weather_index=2.0) == mults(
+            season_index=1.0, shock_index=-1.0, weather_index=1.0
+        )
+        assert mults(weather_index=-0.5) == mults(weather_index=0.0)
+
+    def test_estimate_with_sigma(self):
+        estimate_value, confidence_band, _ = estimate(
+            SINGLE_MARKET_PRICES, SINGLE_MARKET_DISTANCES, None, sigma=7.5
+        )
+
+        assert confidence_band == (estimate_value - 7.5, estimate_value + 7.5)
@@ -1,75 +1,66 @@
 import pytest
 import json
 from datetime import datetime, timezone
-from app.main import create_app
 from app.extensions import db
-from app.models import User, Market, MarketPrice
+from sqlalchemy import insert
+from app.models import Market, MarketPrice, ModelState
 from app.utils.jwt_utils import create_access_token
 
+pytestmark = pytest.mark.usefixtures("clean_tables")
 
-@pytest.fixture
-def app():
-    app = create_app("testing")
-    with app.app_context():
-        db.create_all()
-        yield app
-        db.session.remove()
-        db.drop_all()
 
-
-@pytest.fixture
-def client(app):
-    return app.test_client()
+@pytest.fixture(scope="session")
+def auth_token():
+    # The price routes only verify the token, so one per session is enough
+    return create_access_token(sub=1)
 
 
 @pytest.fixture
-def auth_token(app):
-    with app.app_context():
-        user = User(username="testuser", password_hash="dummy")
-        db.session.add(user)
-        db.session.commit()
-        token = create_access_token(sub=user.id)
-        return token
+def auth_client(app, auth_token):
+    """A test client that sends the bearer token on every request"""
+    client = app.test_client()
+    client.environ_base["HTTP_AUTHORIZATION"] = f"Bearer {auth_token}"
+    return client
 
 
 @pytest.fixture
 def sample_data(app):
     with app.app_context():
         # Create markets
-        markets = [
-            Market(name="Nairobi", lat=-1.2921, lon=36.8219),
-            Market(name="Nakuru", lat=-0.3031, lon=36.0800),
-            Market(name="Nyeri", lat=-0.4167, lon=36.9500),
-        ]
-        for market in markets:
-            db.session.add(market)
-        db.session.commit()
+        db.session.execute(
+            insert(Market),
+            [
+                {"name": "Nairobi", "lat": -1.2921, "lon": 36.8219},
+                {"name": "Nakuru", "lat": -0.3031, "lon": 36.0800},
+                {"name": "Nyeri", "lat": -0.4167, "lon": 36.9500},
+            ],
+        )
 
         # Create sample prices
-        from datetime import datetime, timezone
-
-        prices = [
-            MarketPrice(
-                market_id=1,
-                date=datetime.now(timezone.utc),
-                price_kg=100.0,
-                source="test",
-            ),
-            MarketPrice(
-                market_id=2,
-                date=datetime.now(timezone.utc),
-                price_kg=90.0,
-                source="test",
-            ),
-            MarketPrice(
-                market_id=3,
-                date=datetime.now(timezone.utc),
-                price_kg=95.0,
-                source="test",
-            ),
-        ]
-        for price in prices:
-            db.session.add(price)
+        now = datetime.now(timezone.utc)
+        db.session.execute(
+            insert(MarketPrice),
+            [
+                {
+                    "market_id": 1,
+                    "date": now,
+                    "price_kg": 100.0,
+                    "source": "test",
+                },
+                {
+                    "market_id": 2,
+                    "date": now,
+                    "price_kg": 90.0,
+                    "source": "test",
+                },
+                {
+                    "market_id": 3,
+                    "date": now,
+                    "price_kg": 95.0,
+                    "source": "test",
+                },
+            ],
+        )
         db.session.commit()
 
 
@@ -93,8 +84,8 @@ class TestPrices:
 
         assert response.status_code == 401
 
-    def test_estimate_success(self, client, auth_token, sample_data):
-        response = client.post(
+    def test_estimate_success(self, auth_client, sample_data):
+        response = auth_client.post(
             "/prices/estimate",
             data=json.dumps(
                 {
@@ -106,7 +97,6 @@ class TestPrices:
                 }
             ),
             content_type="application/json",
-            headers={"Authorization": f"Bearer {auth_token}"},
         )
 
         assert response.status_code == 200
@@ -120,8 +110,8 @@ class TestPrices:
         assert len(data["range"]) == 2
         assert data["range"][0] < data["estimate"] < data["range"][1]
 
-    def test_estimate_with_overrides(self, client, auth_token, sample_data):
-        response = client.post(
+    def test_estimate_with_overrides(self, auth_client, sample_data):
+        response = auth_client.post(
             "/prices/estimate",
             data=json.dumps(
                 {
@@ -132,7 +122,6 @@ class TestPrices:
                 }
             ),
             content_type="application/json",
-            headers={"Authorization": f"Bearer {auth_token}"},
         )
 
         assert response.status_code == 200
@@ -142,12 +131,11 @@ class TestPrices:
         assert data["explain"]["logistics_mult"] == 1.20
         assert data["explain"]["variety_mult"] == 1.2
 
-    def test_estimate_invalid_logistics_mode(self, client, auth_token):
-        response = client.post(
+    def test_estimate_invalid_logistics_mode(self, auth_client):
+        response = auth_client.post(
             "/prices/estimate",
             data=json.dumps({"location": "Nairobi", "logistics_mode": "invalid_mode"}),
             content_type="application/json",
-            headers={"Authorization": f"Bearer {auth_token}"},
         )
 
         assert response.status_code == 400
@@ -194,8 +182,8 @@ class TestPrices:
         assert market_data["county"] == "Nairobi"
         assert market_data["latest_price"]["price_kg"] == 95.0
 
-    def test_estimate_weather_override(self, client, auth_token, sample_data):
-        response = client.post(
+    def test_estimate_weather_override(self, auth_client, sample_data):
+        response = auth_client.post(
             "/prices/estimate",
             data=json.dumps(
                 {
@@ -205,7 +193,6 @@ class TestPrices:
                 }
             ),
             content_type="application/json",
-            headers={"Authorization": f"Bearer {auth_token}"},
         )
 
         assert response.status_code == 200
@@ -213,3 +200,88 @@ class TestPrices:
 
         # Weather impact should be reflected in the multiplier
         assert data["explain"]["weather_mult"] > 1.0
+
+    def test_estimate_etag_not_modified(self, auth_client, sample_data):
+        payload = json.dumps(
+            {
+                "location": "Nairobi",
+                "logistics_mode": "wholesale",
+                "overrides": {"Nairobi": 100.0, "Nakuru": 100.0, "Nyeri": 100.0},
+            }
+        )
+
+        response = auth_client.post(
+            "/prices/estimate",
+            data=payload,
+            content_type="application/json",
+        )
+        assert response.status_code == 200
+        assert response.headers["Cache-Control"] == "private, max-age=300"
+        etag = response.headers["ETag"]
+
+        response = auth_client.post(
+            "/prices/estimate",
+            data=payload,
+            content_type="application/json",
+            headers={"If-None-Match": etag},
+        )
+        assert response.status_code == 304
+        assert response.data == b""
+
+    def test_estimate_smooths_with_previous_base(self, auth_client, sample_data):
+        for price, expected_base in ((100.0, 100.0), (200.0, 140.0)):
+            response = auth_client.post(
+                "/prices/estimate",
+                data=json.dumps(
+                    {
+                        "location": "Nairobi",
+                        "logistics_mode": "wholesale",
+                        "overrides": {
+                            "Nairobi": price,
+                            "Nakuru": price,
+                            "Nyeri": price,
+                        },
+                    }
+                ),
+                content_type="application/json",
+            )
+            assert response.status_code == 200
+            # Second call smooths against the base the first one stored
+            assert (
+                json.loads(response.data)["explain"]["base_smoothed"] == expected_base
+            )
+
+    def test_estimate_does_not_overwrite_newer_base(
+        self, app, auth_client, sample_data
+    ):
+        payload = json.dumps(
+            {
+                "location": "Nairobi",
+                "logistics_mode": "wholesale",
+                "overrides": {"Nairobi": 100.0, "Nakuru": 100.0, "Nyeri": 100.0},
+            }
+        )
+        response = auth_client.post(
+            "/prices/estimate", data=payload, content_type="application/json"
+        )
+        assert response.status_code == 200
+
+        # Another worker moves the base after this one last read it
+        with app.app_context():
+            state = db.session.execute(
+                db.select(ModelState).filter_by(key="base:Nairobi")
+            ).scalar_one()
+            state.value = {"base": 300.0}
+            db.session.commit()
+
+        response = auth_client.post(
+            "/prices/estimate", data=payload, content_type="application/json"
+        )
+        assert response.status_code == 200
+        # Smoothed against the newer base: 0.4 * 100 + 0.6 * 300
+        assert json.loads(response.data)["explain"]["base_smoothed"] == 220.0
+        with app.app_context():
+            state = db.session.execute(
+                db.select(ModelState).filter_by(key="base:Nairobi")
+            ).scalar_one()
+            assert state.value == {"base": 220.0}
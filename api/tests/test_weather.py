@@ -0,0 +1,105 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.extensions import db
+from app.models import Market, WeatherData
+from app.weather import clear_market_location_cache, market_location
+
+pytestmark = pytest.mark.usefixtures("clean_tables")
+
+
+@pytest.fixture
+def sample_weather(app):
+    with app.app_context():
+        nairobi = Market(name="Nairobi", lat=-1.2921, lon=36.8219)
+        nakuru = Market(name="Nakuru", lat=-0.3031, lon=36.0800)
+        nyeri = Market(name="Nyeri", lat=-0.4167, lon=36.9500)
+        db.session.add_all([nairobi, nakuru, nyeri])
+        db.session.commit()
+
+        now = datetime.now(timezone.utc)
+        readings = [
+            WeatherData(
+                market_id=nairobi.id,
+                timestamp=now - timedelta(hours=2),
+                rain_mm=1.0,
+                weather_code="500",
+                weather_index=0.1,
+            ),
+            WeatherData(
+                market_id=nairobi.id,
+                timestamp=now,
+                rain_mm=4.0,
+                weather_code="501",
+                weather_index=0.4,
+            ),
+            WeatherData(
+                market_id=nakuru.id,
+                timestamp=now,
+                rain_mm=0.0,
+                weather_code="800",
+                weather_index=0.0,
+            ),
+        ]
+        db.session.add_all(readings)
+        db.session.commit()
+
+
+class TestWeather:
+    def test_latest_weather_batch(self, client, sample_weather):
+        response = client.get("/weather/latest?locations=Nairobi,Nakuru,Nyeri,Atlantis")
+        assert response.status_code == 200
+        data = response.get_json()["locations"]
+        assert set(data) == {"Nairobi", "Nakuru", "Nyeri", "Atlantis"}
+        assert data["Nairobi"]["rain_mm"] == 4.0
+        assert data["Nairobi"]["weather_code"] == "501"
+        assert data["Nakuru"]["weather_index"] == 0.0
+        assert data["Nyeri"] is None
+        assert data["Atlantis"] is None
+
+    def test_latest_weather_missing_location(self, client):
+        response = client.get("/weather/latest")
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "missing_location"
+
+    def test_latest_weather_batch_rejects_empty_list(self, client):
+        response = client.get("/weather/latest?locations=,")
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "missing_location"
+
+    def test_latest_weather_from_database(self, client, sample_weather):
+        response = client.get("/weather/latest?location=Nairobi")
+        assert response.status_code == 200
+        data = response.get_json()
+        assert data["source"] == "database"
+        assert data["rain_mm"] == 4.0
+
+    def test_latest_weather_unknown_location(self, client, sample_weather):
+        response = client.get("/weather/latest?location=Atlantis")
+        assert response.status_code == 404
+        assert response.get_json()["error"] == "unknown_location"
+
+    def test_latest_weather_etag_not_modified(self, client, sample_weather):
+        response = client.get("/weather/latest?location=Nairobi")
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+
+        response = client.get(
+            "/weather/latest?location=Nairobi", headers={"If-None-Match": etag}
+        )
+        assert response.status_code == 304
+        assert response.data == b""
+
+    def test_market_location_cache_is_cleared(self, app, sample_weather):
+        with app.app_context():
+            assert market_location("Nairobi")[1:] == (-1.2921, 36.8219)
+            db.session.execute(
+                db.update(Market).where(Market.name == "Nairobi").values(lat=-1.3)
+            )
+            db.session.commit()
+
+            # Served from the app's cache until it's cleared
+            assert market_location("Nairobi")[1] == -1.2921
+            clear_market_location_cache()
+            assert market_location("Nairobi")[1] == -1.3